@@ -70,21 +70,15 @@ class EligibileFilter(admin.SimpleListFilter):
 
 
 def requalify(modeladmin, request, queryset):
-    for object in queryset:
-        object.standing = models.Team.GOOD_STANDING
-        object.save()
+    queryset.update(standing=models.Team.GOOD_STANDING)
 
 
 def disqualify(modeladmin, request, queryset):
-    for object in queryset:
-        object.standing = models.Team.DISQUALIFIED_STANDING
-        object.save()
+    queryset.update(standing=models.Team.DISQUALIFIED_STANDING)
 
 
 def make_invisible(modeladmin, request, queryset):
-    for object in queryset:
-        object.standing = models.Team.INVISIBLE_STANDING
-        object.save()
+    queryset.update(standing=models.Team.INVISIBLE_STANDING)
 
 
 # endregion
@@ -102,6 +96,7 @@ class UserAdmin(BaseUserAdmin):
     inlines = (CompetitorInline,)
     date_hierarchy = 'date_joined'
     list_display = ('username', 'team', 'email', 'first_name', 'last_name', 'is_staff')
+    list_select_related = ('competitor__team',)
 
     def team(self, user):
         try:
@@ -149,14 +144,20 @@ class TimerAdmin(AllFieldModelAdmin):
 
 
 class CtfProblemAdmin(AllFieldModelAdmin):
-    EXCLUDE = ('id', 'description_raw', 'hint_raw', 'grader')
+    EXCLUDE = ('id', 'description_raw', 'hint_raw', 'grader', 'source_hash')
     search_fields = ('name', 'window__codename')
     list_filter = ('window',)
 
+    def save_model(self, request, obj, form, change):
+        # (This makes `loadprobs` overwrite admin edits with the problem file again.)
+        obj.source_hash = ''
+        super().save_model(request, obj, form, change)
+
 
 class SolveAdmin(AllFieldModelAdmin):
     INCLUDE = ('window',)
     EXCLUDE = ()
+    list_select_related = ('problem__window', 'competitor__user', 'competitor__team')
     list_filter = ('problem__window',)
     date_hierarchy = 'date'
     search_fields = (
@@ -177,6 +178,7 @@ class SubmissionAdmin(AllFieldModelAdmin):
     date_hierarchy = 'date'
     readonly_fields = ('date',)
     list_display_links = ('date',)
+    list_select_related = ('problem', 'competitor__user', 'competitor__team')
     list_filter = ('correct',)
     search_fields = (
         'problem__name',
@@ -192,12 +194,19 @@ class AnnouncementAdmin(admin.ModelAdmin):
     date_hierarchy = 'date'
     list_display_links = ('title',)
     filter_horizontal = ('competitors', 'problems')
+    list_select_related = ('window',)
     list_filter = ('window',)
     search_fields = (
         'title',
         'body',
     )
 
+    def formfield_for_manytomany(self, db_field, request=None, **kwargs):
+        # (Each competitor's string representation needs its user and team.)
+        if db_field.name == 'competitors':
+            kwargs['queryset'] = models.Competitor.objects.select_related('user', 'team')
+        return super().formfield_for_manytomany(db_field, request, **kwargs)
+
 
 # endregion
 
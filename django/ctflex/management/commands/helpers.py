@@ -1,8 +1,9 @@
 """Define common functionality and helpers for management commands"""
 
+import os
+import shutil
 import sys
 
-from IPython.core import ultratb
 from django.core.management import CommandError
 
 DEBUG_OPTION_NAME = 'debug'
@@ -23,9 +24,24 @@ def debug_with_pdb(**options):
     stacktrace and quit).
     """
     if options[DEBUG_OPTION_NAME]:
+        # (IPython is imported lazily as every management command imports this module.)
+        from IPython.core import ultratb
         sys.excepthook = ultratb.FormattedTB(mode='Verbose', color_scheme='Linux', call_pdb=1)
 
 
+def link_or_copy(src, dst):
+    """Hard-link a file, falling back to copying it if linking fails
+
+    Linking fails when, e.g., the destination is on a different device or the
+    filesystem does not support hard links. This function can be passed as
+    the `copy_function` to `shutil.copytree`.
+    """
+    try:
+        os.link(src, dst)
+    except OSError:
+        shutil.copy2(src, dst)
+
+
 # endregion
 
 
@@ -48,4 +64,10 @@ def add_clear_argument(parser):
                         action='store_true', dest='clear', default=False,
                         help="Clear existing content if it wasn't just updated.")
 
+
+def add_force_argument(parser):
+    parser.add_argument('--force', '-f',
+                        action='store_true', dest='force', default=False,
+                        help="Reload content even if its source has not changed.")
+
 # endregion
@@ -1,3 +1,5 @@
+import copy
+import hashlib
 import os
 import re
 import shutil
@@ -14,6 +16,11 @@ from django.db import transaction
 import yaml
 import yaml.parser
 
+try:
+    from yaml import CSafeLoader as SafeLoader
+except ImportError:
+    from yaml import SafeLoader
+
 from ctflex import constants
 from ctflex import settings
 from ctflex.management.commands import helpers
@@ -31,6 +38,35 @@ UUID_BACKUP_BASENAME = '.uuid.rejected'
 
 PK_FIELD = 'id'
 
+UUID_PATTERN = re.compile('{}$'.format(constants.UUID_REGEX))
+
+BULK_BATCH_SIZE = 500
+
+
+def hash_source(prob_path, contents):
+    """Return a hash of a problem folder's path and problem file contents
+
+    (The path is included because the grader path and window are derived from it.)
+    """
+    return hashlib.sha256(prob_path.encode() + b'\0' + contents).hexdigest()
+
+
+def load_problem_file(prob_path, previous_hash):
+    """Return the source hash of a problem folder and its parsed problem file
+
+    If the source hash equals `previous_hash`, the problem file is not parsed
+    and `None` is returned in its place.
+    """
+    # (Passing bytes lets libyaml decode the file itself, which benchmarks
+    # slightly faster than passing a text file object or a decoded string.)
+    with open(join(prob_path, PROBLEMFILE_BASENAME), 'rb') as problem_file:
+        contents = problem_file.read()
+
+    source_hash = hash_source(prob_path, contents)
+    if source_hash == previous_hash:
+        return source_hash, None
+    return source_hash, yaml.load(contents, Loader=SafeLoader)
+
 
 class Command(BaseCommand):
     help = "Load problems atomically (with static files)"
@@ -39,27 +75,28 @@ class Command(BaseCommand):
         helpers.add_no_input_argument(parser)
         helpers.add_debug_argument(parser)
         helpers.add_clear_argument(parser)
+        helpers.add_force_argument(parser)
 
     def walk(self, directory):
         """Yield sub-directories that don't begin with an underscore"""
 
         # Walk over the directory
+        # (`scandir` caches file types from reading the directory, saving a `stat` per entry.)
         self.stdout.write("Walking directory '{}'".format(directory))
-        for basename in os.listdir(directory):
+        for entry in os.scandir(directory):
             self.stdout.write("")
-            path = join(directory, basename)
 
             # Skip files
-            if isfile(path):
-                self.stdout.write("Ignoring '{}': Is file".format(basename))
+            if entry.is_file():
+                self.stdout.write("Ignoring '{}': Is file".format(entry.name))
                 continue
 
             # Ignore private dirs
-            if basename.startswith('_') or basename.startswith('.'):
-                self.stdout.write("Ignoring '{}': Marked private with underscore or dot".format(basename))
+            if entry.name.startswith('_') or entry.name.startswith('.'):
+                self.stdout.write("Ignoring '{}': Marked private with underscore or dot".format(entry.name))
                 continue
 
-            yield basename, path
+            yield entry.name, entry.path
 
     def handle_error(self, err):
 
@@ -69,15 +106,44 @@ class Command(BaseCommand):
         else:
             self.stdout.write(''.join(traceback.format_exception(*sys.exc_info())))
 
-    def process_problem_folder(self, *, prob_path, prob_basename, window_basename):
+    def read_uuid(self, prob_path):
+        """Return the UUID in a problem folder's UUID file if it exists and is valid"""
+
+        uuid_path = join(prob_path, UUID_BASENAME)
+        if not isfile(uuid_path):
+            return None
+
+        with open(uuid_path) as uuid_file:
+            uuid = uuid_file.read().strip()
+        return uuid if UUID_PATTERN.match(uuid) else None
+
+    def copy_static_files(self, *, prob_path, prob_identifier, uuid):
+        """Copy over any static files of a problem and return whether that succeeded"""
+
+        try:
+            static_from = join(prob_path, STATICFOLDER_BASENAME)
+            static_to = join(PROBLEMS_STATIC_DIR, str(uuid))
+
+            if isdir(static_from):
+                self.stdout.write("Trying to copy static files from '{}'".format(prob_identifier))
+                shutil.copytree(static_from, static_to, copy_function=helpers.link_or_copy)
+
+        except (shutil.Error, IOError) as err:
+            self.stderr.write("Unable to copy static files for '{}'".format(prob_identifier))
+            self.handle_error(err)
+            return False
+
+        return True
+
+    def process_problem_folder(self, *, prob_path, prob_basename, window_basename, uuid):
 
         prob_identifier = "{}/{}".format(window_basename, prob_basename)
 
         # Load problem file
-        problem_filename = join(prob_path, PROBLEMFILE_BASENAME)
+        problem = self.existing_problems.get(uuid)
+        previous_hash = problem.source_hash if problem is not None and not self.force else None
         try:
-            with open(problem_filename) as problem_file:
-                data = yaml.load(problem_file)
+            source_hash, data = load_problem_file(prob_path, previous_hash)
         except (IsADirectoryError, FileNotFoundError):
             self.stderr.write("Skipping '{}': No problems file found".format(prob_identifier))
             # self.handle_error(err)
@@ -87,6 +153,13 @@ class Command(BaseCommand):
             self.handle_error(err)
             return
 
+        # Skip saving problems whose source has not changed
+        if problem is not None and source_hash == previous_hash:
+            self.stdout.write("Problem for '{}' is unchanged".format(prob_identifier))
+            if self.copy_static_files(prob_path=prob_path, prob_identifier=prob_identifier, uuid=problem.id):
+                self.unchanged_problems.append(problem)
+            return
+
         # Set paths
         data['grader'] = join(prob_path, GRADER_BASENAME)
         if 'dynamic' in data:
@@ -102,25 +175,18 @@ class Command(BaseCommand):
                     """.format(UUID_BASENAME, prob_identifier)))
             del data['id']
 
-        # Check for and validate existing UUID file
+        # Back up any existing UUID file that was not valid
         uuid_path = join(prob_path, UUID_BASENAME)
-        if isfile(uuid_path):
-            with open(uuid_path) as uuid_file:
-                uuid = uuid_file.read().strip()
-                data[PK_FIELD] = uuid
-
-            if not re.match('{}$'.format(constants.UUID_REGEX), uuid):
-                self.stderr.write(
-                    "Error: UUID File did not match the expected format '{}'".format(
-                        constants.UUID_REGEX))
-                uuid = None
-
-                self.stderr.write("Backing up and deleting existing UUID file")
-                backip_uuid_path = join(prob_path, UUID_BACKUP_BASENAME)
-                shutil.move(uuid_path, backip_uuid_path)
-
-        # Else, generate a UUID
-        else:
+        if uuid is None and isfile(uuid_path):
+            self.stderr.write(
+                "Error: UUID File did not match the expected format '{}'".format(
+                    constants.UUID_REGEX))
+
+            self.stderr.write("Backing up and deleting existing UUID file")
+            shutil.move(uuid_path, join(prob_path, UUID_BACKUP_BASENAME))
+
+        # Generate a UUID if there was no valid one
+        if uuid is None:
             uuid = str(constants.UUID_GENERATOR())
             self.stdout.write("Creating a UUID file for '{}'".format(prob_identifier))
             with open(uuid_path, 'w') as uuid_file:
@@ -128,73 +194,79 @@ class Command(BaseCommand):
 
         # Add window and add defaults
         try:
-            data['window'] = Window.objects.get(codename=window_basename)
-        except Window.DoesNotExist as err:
+            data['window'] = self.windows[window_basename]
+        except KeyError as err:
             self.stderr.write("No window named {!r} found".format(window_basename))
             self.handle_error(err)
             return
 
         # Configure fields
-        data['id'] = uuid
+        data[PK_FIELD] = uuid
         data.setdefault('generator', None)
         data['description_raw'] = data.pop('description', '')
         data['hint_raw'] = data.pop('hint', '')
+        data['source_hash'] = source_hash
 
         # Remove extra fields
         for attr in set(data.keys()) - set(field.name for field in CtfProblem._meta.get_fields()):
             del data[attr]
 
-        # If problem exists, update it
-        query = CtfProblem.objects.filter(**{PK_FIELD: uuid})
-        if uuid and query.exists():
+        # If problem exists, apply the loaded fields to a copy of it
+        # (Fields missing from the problem file keep their stored values.)
+        if problem is not None:
             self.stdout.write("Trying to update problem for '{}'".format(prob_identifier))
-            problem = query.get()
+            cleaned_problem = copy.copy(problem)
             for attr, value in data.items():
-                setattr(problem, attr, value)
+                setattr(cleaned_problem, attr, value)
 
         # Otherwise, create a new problem
         else:
             self.stdout.write("Trying to create problem for '{}'".format(prob_identifier))
-            problem = CtfProblem(**data)
+            cleaned_problem = CtfProblem(**data)
 
-        # Validate and save to list
+        # Validate
+        # (Saving does not happen through `save()`, so the pre-save full clean does not
+        # run. The window was just fetched, so checking that it exists is skipped.)
         try:
-            problem.clean()
+            cleaned_problem.full_clean(exclude=('window',), validate_unique=False)
         except ValidationError as err:
             self.stderr.write("Validation failed for '{}'".format(prob_identifier))
             self.handle_error(err)
             return
 
-        self.processed_problems.append(problem)
-
-        # Copy over any static files
-        try:
-            static_from = join(prob_path, STATICFOLDER_BASENAME)
-            static_to = join(PROBLEMS_STATIC_DIR, str(uuid))
+        # If problem exists, save its cleaned fields to update it
+        if problem is not None:
+            self.updated_problems[uuid] = {attr: getattr(cleaned_problem, attr)
+                                           for attr in data if attr != PK_FIELD}
 
-            if isdir(static_from):
-                self.stdout.write("Trying to copy static files from '{}'".format(prob_identifier))
-                shutil.copytree(static_from, static_to)
+        # Otherwise, save it to create a new problem
+        else:
+            self.created_problems.append(cleaned_problem)
 
-        except (shutil.Error, IOError) as err:
-            self.stderr.write("Unable to copy static files for '{}'".format(prob_identifier))
-            self.handle_error(err)
+        # Copy over any static files
+        if not self.copy_static_files(prob_path=prob_path, prob_identifier=prob_identifier, uuid=uuid):
             return
 
         # We made it!
         self.stdout.write("Validated problem for '{}'".format(prob_identifier))
 
-    def delete_unprocessed(self, options):
-        """Delete existing problems that were not updated if clear option was given
+    def confirm_delete_unprocessed(self, options):
+        """Return existing problems that were not updated if clear option was given and confirmed
 
         (This action is so dangerous that even passing in '--no-input'
         does not automatically approve it.)
         """
 
-        unprocessed_problems = CtfProblem.objects.exclude(
-            pk__in=[problem.id for problem in self.processed_problems]).all()
+        if not options['clear']:
+            return CtfProblem.objects.none()
+
+        # (A set difference in Python avoids a NOT IN clause with every processed ID.)
+        processed_ids = ({str(problem.id) for problem in self.created_problems + self.unchanged_problems}
+                         | set(self.updated_problems))
+        all_ids = {str(pk) for pk in CtfProblem.objects.values_list('id', flat=True)}
+        unprocessed_problems = CtfProblem.objects.filter(pk__in=list(all_ids - processed_ids))
 
-        if options['clear'] and unprocessed_problems:
+        if unprocessed_problems:
 
             affirmative_answer = "yes_this_is_dangerous"
             message = textwrap.dedent("""\
@@ -219,20 +291,28 @@ class Command(BaseCommand):
                                   .format(affirmative_answer))
 
             else:
-                self.stdout.write("\nDeleting all unprocessed problems\n\n")
-                for problem in unprocessed_problems:
-                    problem.delete()
+                return unprocessed_problems
+
+        return CtfProblem.objects.none()
 
     def handle(self, **options):
 
         write = self.stdout.write
-        self.processed_problems = []
+        self.created_problems = []
+        self.updated_problems = {}
+        self.unchanged_problems = []
 
         # Initialize error handling
         self.errored = False
         self.debug = options[helpers.DEBUG_OPTION_NAME]
+        self.force = options['force']
         helpers.debug_with_pdb(**options)
 
+        # Don't block on prompts when input is redirected (e.g., in automated deploys)
+        if options['interactive'] and not sys.stdin.isatty():
+            self.stderr.write("WARNING: Standard input is not a terminal; proceeding as if --no-input were given")
+            options['interactive'] = False
+
         # Delete any existing files after confirmation
         if isdir(PROBLEMS_STATIC_DIR):
             message = textwrap.dedent("""\
@@ -252,14 +332,29 @@ class Command(BaseCommand):
             shutil.rmtree(PROBLEMS_STATIC_DIR)
         os.makedirs(PROBLEMS_STATIC_DIR, exist_ok=True)
 
-        # Load problems
+        # Fetch all windows at once instead of querying for each problem
+        self.windows = {window.codename: window for window in Window.objects.all()}
+
+        # Find problem folders
+        folders = []
         for window_basename, window_path in self.walk(PROBLEMS_DIR):
             for prob_basename, prob_path in self.walk(window_path):
-                self.process_problem_folder(
+                folders.append(dict(
                     window_basename=window_basename,
                     prob_basename=prob_basename,
-                    prob_path=prob_path
-                )
+                    prob_path=prob_path,
+                    uuid=self.read_uuid(prob_path),
+                ))
+
+        # Fetch all existing problems at once instead of querying for each problem
+        uuids = [folder['uuid'] for folder in folders if folder['uuid']]
+        self.existing_problems = {str(pk): problem for pk, problem in CtfProblem.objects.in_bulk(uuids).items()}
+
+        # Load problems
+        # (Problem files are parsed serially: with libyaml, parsing one takes tens of
+        # microseconds, far less than forking worker processes of this command would.)
+        for folder in folders:
+            self.process_problem_folder(**folder)
 
         # Stop if errors were encountered
         if self.errored:
@@ -275,18 +370,26 @@ class Command(BaseCommand):
         }))
 
 
+        # Confirm deleting unprocessed problems before starting the transaction
+        unprocessed_problems = self.confirm_delete_unprocessed(options)
+
         self.stdout.write("Beginning transaction to actually save problems\n")
         try:
 
-            # Actually load problems
+            # Actually load problems and delete unprocessed ones in one transaction
             with transaction.atomic():
-                print(self.processed_problems)
-                for problem in self.processed_problems:
-                    print("Saving {} to window {}".format(problem, problem.window))
-                    problem.save()
-
-            # Delete unprocessed problems
-            self.delete_unprocessed(options)
+                write("Creating {} new problem(s)".format(len(self.created_problems)))
+                CtfProblem.objects.bulk_create(self.created_problems, batch_size=BULK_BATCH_SIZE)
+
+                # (Django 1.9 has no `bulk_update`, so existing problems are updated one query each.)
+                write("Updating {} existing problem(s)".format(len(self.updated_problems)))
+                for uuid, data in self.updated_problems.items():
+                    CtfProblem.objects.filter(pk=uuid).update(**data)
+
+                # Delete unprocessed problems
+                if unprocessed_problems:
+                    write("\nDeleting all unprocessed problems\n\n")
+                    unprocessed_problems.delete()
 
         except Exception as err:
             self.stderr.write("Unforeseen exception encountered while saving problems; rolled back transaction")
@@ -19,17 +19,25 @@ class RatelimitMiddleware:
 
     The reason this simulation has to happen is that the original middleware
     would import `import_module` from a location that doesn’t work with Django 1.9.
+    The view is resolved once when the middleware is loaded, not on every exception.
     """
 
+    def __init__(self):
+        # (The setting is optional, so without it ratelimited requests get a 403.)
+        if not settings.RATELIMIT_VIEW:
+            self.view = None
+            return
+
+        module_name, _, view_name = settings.RATELIMIT_VIEW.rpartition('.')
+        module = import_module(module_name)
+        self.view = getattr(module, view_name)
+
     def process_exception(self, request, exception):
         """Copied over from `ratelimit.middleware.RatelimitMiddleware.process_exception`"""
 
-        if not isinstance(exception, Ratelimited):
+        if not isinstance(exception, Ratelimited) or self.view is None:
             return
-        module_name, _, view_name = settings.RATELIMIT_VIEW.rpartition('.')
-        module = import_module(module_name)
-        view = getattr(module, view_name)
-        return view(request, exception)
+        return self.view(request, exception)
 
 
 class IncubatingMiddleware:
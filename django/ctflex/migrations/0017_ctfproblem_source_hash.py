@@ -0,0 +1,19 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('ctflex', '0016_remove_team_banned'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='ctfproblem',
+            name='source_hash',
+            field=models.CharField(blank=True, default='', editable=False, max_length=64),
+        ),
+    ]
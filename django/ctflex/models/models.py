@@ -469,6 +469,9 @@ class CtfProblem(models.Model):
     # Dictionary for problem dependencies in format specified in README
     deps = psql.JSONField(blank=True, null=True)
 
+    # Hash of the problem's source, used by `loadprobs` to skip unchanged problems
+    source_hash = models.CharField(max_length=64, default='', blank=True, editable=False)
+
     def __str__(self):
         return "#{} {!r}".format(self.id, self.name)
 